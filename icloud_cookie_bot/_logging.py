@@ -0,0 +1,60 @@
+# _logging.py
+import os
+import atexit
+import signal
+import logging
+import logging.handlers
+from pathlib import Path
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = Path("logs") / "bot.log"
+
+_configured = False
+_memory_handler = None
+
+def setup_logging():
+    """
+    Configure the root logger for the bot, once per process.
+
+    Records go to the console and to logs/bot.log. File writes are buffered
+    and flushed in batches: when a warning or error is logged, when
+    flush_logs() is called (the scheduler does so after every job), at exit,
+    and on SIGTERM.
+    """
+    global _configured, _memory_handler
+    if _configured:
+        return
+    _configured = True
+
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    file_handler = logging.FileHandler(LOG_FILE)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _memory_handler = logging.handlers.MemoryHandler(1024, flushLevel=logging.WARNING, target=file_handler)
+    atexit.register(_memory_handler.flush)
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=[
+            _memory_handler,
+            logging.StreamHandler()
+        ]
+    )
+
+    # atexit doesn't run when the process is killed with SIGTERM (the usual
+    # way to stop a nohup'ed daemon), so flush before dying from it
+    try:
+        if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, _flush_and_terminate)
+    except ValueError:
+        pass  # not the main thread; leave signal handling alone
+
+def flush_logs():
+    """Write any buffered log records to logs/bot.log."""
+    if _memory_handler is not None:
+        _memory_handler.flush()
+
+def _flush_and_terminate(signum, frame):
+    """SIGTERM handler: flush the log buffer, then terminate as SIGTERM would."""
+    flush_logs()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
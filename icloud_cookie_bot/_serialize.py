@@ -0,0 +1,31 @@
+# _serialize.py
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib json module
+    orjson = None
+
+# Whether loads() can parse a memoryview without copying it first
+HAS_ORJSON = orjson is not None
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """
+    Serialize obj to JSON, using orjson when it is installed.
+
+    Args:
+        obj: The object to serialize
+        indent: Indent by two spaces for files people edit by hand; by
+            default the output is compact
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2) if indent else orjson.dumps(obj)
+    if indent:
+        return json.dumps(obj, indent=2).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    """Parse JSON data, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
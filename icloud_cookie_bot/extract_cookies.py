@@ -1,23 +1,28 @@
 # extract_cookies.py
 import os
-import json
+import hashlib
 import logging
 import sqlite3
 import shutil
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import subprocess
-from typing import Dict, List, Optional
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/bot.log"),
-        logging.StreamHandler()
-    ]
-)
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+try:
+    import posix
+except ImportError:  # Windows
+    posix = None
+
+from _logging import setup_logging
+from _serialize import dumps, loads
+
 logger = logging.getLogger("cookie_extractor")
 
 # iCloud cookie names we need to extract
@@ -30,32 +35,88 @@ REQUIRED_COOKIES = [
     'X-APPLE-ID-TOKEN'
 ]
 
+# Cookies on these domains or any of their subdomains (appleid.apple.com,
+# setup.icloud.com, ...) count as Apple/iCloud cookies
+APPLE_DOMAINS = ('.apple.com', '.icloud.com')
+
+# We only ever read from the Cookies DB (or a throwaway copy of it), so
+# journaling and fsync are pure overhead
+READ_PRAGMAS = """
+    PRAGMA journal_mode=OFF;
+    PRAGMA synchronous=OFF;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA query_only=1;
+"""
+
+# Autocommit mode skips the implicit transaction bookkeeping around our
+# SELECTs; check_same_thread=False only drops sqlite3's thread-affinity check
+CONNECT_OPTIONS = {
+    'isolation_level': None,
+    'check_same_thread': False,
+    'cached_statements': 64
+}
+
+# Parameters Chrome on macOS uses to derive its cookie encryption key
+CHROME_KEY_SALT = b'saltysalt'
+CHROME_KEY_ITERATIONS = 1003
+CHROME_KEY_LENGTH = 16
+
+# From this Cookies database version on, Chrome puts a SHA-256 hash of the
+# cookie's host_key in front of the plaintext before encrypting it
+HOST_HASH_DB_VERSION = 24
+HOST_HASH_LENGTH = 32
+
+# Guards the keychain lookup and key derivation; the key is cached once derived
+_KEY_LOCK = threading.Lock()
+_cookie_key: Optional[bytes] = None
+
+# Map up to 512 MB of the database into memory so pages are read straight
+# from the OS page cache instead of being copied into SQLite's own cache
+MMAP_SIZE = 512 * 1024 * 1024
+
 class CookieExtractor:
     def __init__(self, config_path="config.json"):
         """Initialize the cookie extractor with the specified configuration."""
         self.config = self._load_config(config_path)
+        # The configured Chrome profiles, read from the config once
+        self.profiles: List[dict] = self.config.get("profiles", [])
         self.sessions_dir = Path("sessions")
         self.sessions_dir.mkdir(exist_ok=True)
         
+        # Stat of each profile's Cookies file as of its last fresh extraction;
+        # None when cookies were missing, so the result isn't reused as-is
+        self._source_stats: Dict[str, Optional[os.stat_result]] = {}
+        
+        # Shared by all profiles for fallback copies of their Cookies DB;
+        # removed automatically when the extractor goes away or at exit
+        self._tmpdir = tempfile.TemporaryDirectory(prefix="cookie_extract_")
+        
     def _load_config(self, config_path: str) -> dict:
         """Load the configuration from a JSON file."""
         try:
-            with open(config_path, 'r') as f:
-                return json.load(f)
+            with open(config_path, 'rb') as f:
+                return loads(f.read())
         except Exception as e:
             logger.error(f"Failed to load configuration: {e}")
             return {"profiles": []}
             
     def get_chrome_profiles(self) -> List[dict]:
         """Return the list of configured Chrome profiles."""
-        return self.config.get("profiles", [])
+        return self.profiles
     
     def get_chrome_cookies_path(self, profile_path: str) -> Path:
         """Get the path to the Cookies file for the specified Chrome profile."""
         return Path(profile_path) / "Cookies"
     
-    def extract_cookies_from_profile(self, profile: dict) -> Dict[str, str]:
-        """Extract the required cookies from the specified Chrome profile."""
+    def extract_cookies_from_profile(self, profile: dict, force: bool = False) -> Dict[str, str]:
+        """
+        Extract the required cookies from the specified Chrome profile.
+        
+        If the profile's Cookies file hasn't changed since the last saved
+        session, the cookies from that session are returned instead, unless
+        force is set.
+        """
         profile_id = profile.get("id")
         profile_path = profile.get("path")
         
@@ -65,68 +126,148 @@ class CookieExtractor:
             
         cookies_path = self.get_chrome_cookies_path(profile_path)
         
-        if not cookies_path.exists():
+        try:
+            source_stat = os.stat(cookies_path)
+        except FileNotFoundError:
             logger.error(f"Cookies file not found at {cookies_path}")
             return {}
+        except OSError as e:
+            # e.g. the profile path points at a file rather than a directory
+            logger.error(f"Cannot access cookies file at {cookies_path}: {e}")
+            return {}
+        
+        if not force:
+            cached = self._load_unchanged_session_cookies(profile_id, source_stat)
+            if cached:
+                logger.info(f"Cookies file unchanged for profile {profile_id}, using saved session")
+                return cached
             
+        temp_cookies_path = None
         try:
-            # SQLite database might be locked, so we'll make a copy
-            temp_dir = tempfile.mkdtemp()
-            temp_cookies_path = os.path.join(temp_dir, "Cookies")
-            shutil.copy2(cookies_path, temp_cookies_path)
-            
             # Connect to the database
-            conn = sqlite3.connect(temp_cookies_path)
+            conn, temp_cookies_path = self._connect_cookies_db(cookies_path, profile_id)
             cursor = conn.cursor()
+            cursor.executescript(READ_PRAGMAS)
+            try:
+                cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            except sqlite3.DatabaseError as e:
+                # mmap is disabled on some platforms/builds
+                logger.debug(f"Memory-mapped I/O unavailable: {e}")
+            strip_host_hash = _cookies_db_version(cursor) >= HOST_HASH_DB_VERSION
             
-            # Query for the cookies we need
+            # Chrome normally leaves `value` empty and keeps the data in
+            # `encrypted_value`, so fetch those rows first and only go back for
+            # plaintext values of cookies that are still missing
             cookies = {}
-            for cookie_name in REQUIRED_COOKIES:
+            name_placeholders = ",".join("?" * len(REQUIRED_COOKIES))
+            cursor.execute(
+                f"SELECT name, host_key, encrypted_value FROM cookies WHERE name IN ({name_placeholders}) AND value = ''",
+                REQUIRED_COOKIES
+            )
+            
+            for name, host_key, encrypted_value in cursor:
+                if not _is_apple_host(host_key):
+                    continue
+                    
+                # The cookie value is encrypted, decrypt it
+                if encrypted_value:
+                    decrypted_value = self._decrypt_cookie_value(encrypted_value, strip_host_hash)
+                    if decrypted_value:
+                        cookies[name] = decrypted_value
+            
+            missing_names = [cookie for cookie in REQUIRED_COOKIES if cookie not in cookies]
+            if missing_names:
+                name_placeholders = ",".join("?" * len(missing_names))
                 cursor.execute(
-                    "SELECT name, value, host_key, encrypted_value FROM cookies WHERE name = ? AND host_key LIKE '%apple.com%'", 
-                    (cookie_name,)
+                    f"SELECT name, host_key, value FROM cookies WHERE name IN ({name_placeholders}) AND value != ''",
+                    missing_names
                 )
-                results = cursor.fetchall()
                 
-                for result in results:
-                    name, value, host, encrypted_value = result
-                    
-                    # If the cookie value is encrypted, decrypt it
-                    if not value and encrypted_value:
-                        decrypted_value = self._decrypt_cookie_value(encrypted_value)
-                        if decrypted_value:
-                            cookies[name] = decrypted_value
-                    elif value:
+                for name, host_key, value in cursor:
+                    if _is_apple_host(host_key):
                         cookies[name] = value
             
             conn.close()
-            shutil.rmtree(temp_dir)
             
             # Check if we got all required cookies
             missing_cookies = [cookie for cookie in REQUIRED_COOKIES if cookie not in cookies]
             if missing_cookies:
                 logger.warning(f"Missing cookies for profile {profile_id}: {missing_cookies}")
             
+            # Only a complete set may be served from the saved session later;
+            # a partial one (e.g. keychain denied) must be retried next run
+            self._source_stats[profile_id] = None if missing_cookies else source_stat
             return cookies
         except Exception as e:
             logger.error(f"Error extracting cookies from profile {profile_id}: {e}")
             return {}
+        finally:
+            # Don't leave copies of the cookies lying around between runs
+            if temp_cookies_path:
+                try:
+                    os.unlink(temp_cookies_path)
+                except OSError:
+                    pass
     
-    def _decrypt_cookie_value(self, encrypted_value: bytes) -> Optional[str]:
-        """Decrypt an encrypted cookie value on macOS."""
+    def _load_unchanged_session_cookies(self, profile_id: str,
+                                        source_stat: os.stat_result) -> Optional[Dict[str, str]]:
+        """Return the saved session's cookies if they came from an identical Cookies file."""
+        session_path = self.sessions_dir / f"{profile_id}.json"
+        try:
+            with open(session_path, 'rb') as f:
+                session = loads(f.read())
+        except Exception:
+            return None
+        
+        if (session.get("source_mtime_ns") == source_stat.st_mtime_ns and
+                session.get("source_size") == source_stat.st_size):
+            return session.get("cookies")
+        return None
+    
+    def _connect_cookies_db(self, cookies_path: Path,
+                            profile_id: str) -> Tuple[sqlite3.Connection, Optional[str]]:
+        """
+        Open the Cookies database without copying it where possible.
+        
+        Returns the connection and the path of the temporary copy of the
+        database, or None if the original file was opened in place.
+        """
+        conn = None
+        try:
+            # Immutable read-only opens take no locks, so Chrome holding the
+            # database open doesn't get in the way
+            uri = f"{cookies_path.resolve().as_uri()}?mode=ro&immutable=1&nolock=1"
+            conn = sqlite3.connect(uri, uri=True, **CONNECT_OPTIONS)
+            conn.execute("SELECT 1 FROM cookies LIMIT 1")
+            return conn, None
+        except sqlite3.OperationalError as e:
+            if conn is not None:
+                conn.close()
+            logger.warning(f"Could not open {cookies_path} in place ({e}), falling back to a copy")
+        
+        # SQLite database might be locked, so we'll make a copy
+        temp_cookies_path = os.path.join(self._tmpdir.name, f"{profile_id}.db")
+        _fast_copy(cookies_path, temp_cookies_path)
+        return sqlite3.connect(temp_cookies_path, **CONNECT_OPTIONS), temp_cookies_path
+    
+    def _decrypt_cookie_value(self, encrypted_value: bytes,
+                              strip_host_hash: bool = False) -> Optional[str]:
+        """
+        Decrypt an encrypted cookie value on macOS.
+        
+        strip_host_hash drops the host_key hash that newer Chrome versions put
+        in front of v10 plaintexts (see HOST_HASH_DB_VERSION).
+        """
         try:
             if encrypted_value.startswith(b'v10'):
-                # v10 cookies need a different approach with the macOS keychain
-                cmd = ['security', 'find-generic-password', '-w', '-a', 'Chrome']
-                try:
-                    chrome_key = subprocess.check_output(cmd).strip()
-                    # Further decryption would be needed here with the chrome_key
-                    # This is a complex process requiring PBKDF2 and AES decryption
-                    logger.warning("v10 cookie decryption not fully implemented")
-                    return None
-                except subprocess.CalledProcessError:
-                    logger.error("Failed to get Chrome encryption key from keychain")
+                # v10 cookies need a different approach with the macOS keychain.
+                # The key is fetched and derived once per process; the lock stops
+                # parallel extractions from all prompting the keychain at once
+                with _KEY_LOCK:
+                    key = _chrome_cookie_key()
+                if key is None:
                     return None
+                return _decrypt_v10(encrypted_value, key, strip_host_hash)
             else:
                 # Older cookies might be simpler to decrypt
                 try:
@@ -137,38 +278,87 @@ class CookieExtractor:
             logger.error(f"macOS decryption error: {e}")
             return None
     
-    def extract_all_profiles_cookies(self) -> Dict[str, Dict[str, str]]:
-        """Extract cookies from all configured Chrome profiles."""
+    def extract_all_profiles_cookies(self, force: bool = False) -> Dict[str, Dict[str, str]]:
+        """
+        Extract cookies from all configured Chrome profiles.
+        
+        Profiles whose Cookies file is unchanged since their last saved session
+        are served from that session, unless force is set.
+        """
         all_cookies = {}
         
+        profiles = []
         for profile in self.get_chrome_profiles():
-            profile_id = profile.get("id")
-            if not profile_id:
+            if not profile.get("id"):
                 logger.warning("Profile without ID found in config, skipping")
                 continue
-                
-            logger.info(f"Extracting cookies for profile: {profile_id}")
-            cookies = self.extract_cookies_from_profile(profile)
+            profiles.append(profile)
             
-            if cookies:
-                all_cookies[profile_id] = cookies
-                # Save to individual session file
-                self.save_session(profile_id, cookies)
-            else:
-                logger.warning(f"No cookies extracted for profile {profile_id}")
+        if not profiles:
+            return all_cookies
+            
+        # Profiles are independent and I/O bound, so extract them concurrently
+        with ThreadPoolExecutor(max_workers=min(8, len(profiles))) as executor:
+            futures = {executor.submit(self.extract_profile, profile, force): profile for profile in profiles}
+                
+            for future in as_completed(futures):
+                profile_id = futures[future]["id"]
+                try:
+                    cookies = future.result()
+                except Exception as e:
+                    logger.error(f"Error extracting cookies for profile {profile_id}: {e}")
+                    continue
+                if cookies:
+                    all_cookies[profile_id] = cookies
         
         return all_cookies
     
-    def save_session(self, profile_id: str, cookies: Dict[str, str]) -> bool:
-        """Save the extracted cookies to a session file."""
+    def extract_profile(self, profile: dict, force: bool = False) -> Dict[str, str]:
+        """
+        Extract cookies from a single profile and save them to its session file.
+        
+        Args:
+            profile: The profile to extract from; must have an ID
+            force: Re-extract even if the Cookies file is unchanged
+            
+        Returns:
+            The extracted cookies, or an empty dict if none were found
+        """
+        profile_id = profile["id"]
+        logger.info(f"Extracting cookies for profile: {profile_id}")
+        cookies = self.extract_cookies_from_profile(profile, force)
+        # Only set for fresh extractions, not ones served from the saved session
+        fresh = profile_id in self._source_stats
+        source_stat = self._source_stats.pop(profile_id, None)
+        
+        if cookies:
+            # Save to individual session file
+            if fresh:
+                self.save_session(profile_id, cookies, source_stat)
+        else:
+            logger.warning(f"No cookies extracted for profile {profile_id}")
+            
+        return cookies
+    
+    def save_session(self, profile_id: str, cookies: Dict[str, str],
+                     source_stat: Optional[os.stat_result] = None) -> bool:
+        """
+        Save the extracted cookies to a session file.
+        
+        If given, source_stat (the stat of the Cookies file the cookies came
+        from) is recorded so unchanged profiles can skip re-extraction.
+        """
         try:
             session_path = self.sessions_dir / f"{profile_id}.json"
-            with open(session_path, 'w') as f:
-                json.dump({
-                    "cookies": cookies,
-                    "profile_id": profile_id,
-                    "timestamp": import_time()
-                }, f, indent=2)
+            session = {
+                "cookies": cookies,
+                "profile_id": profile_id,
+                "timestamp": int(time.time())
+            }
+            if source_stat:
+                session["source_mtime_ns"] = source_stat.st_mtime_ns
+                session["source_size"] = source_stat.st_size
+            _write_session(session_path, session)
             logger.info(f"Session saved for profile {profile_id}")
             return True
         except Exception as e:
@@ -182,12 +372,92 @@ class CookieExtractor:
         logger.info("Cookie validation not implemented yet")
         return True
 
-def import_time():
-    """Import time module and return current timestamp."""
-    import time
-    return int(time.time())
+def _is_apple_host(host_key: str) -> bool:
+    """Whether a cookie's host_key is apple.com, icloud.com or a subdomain of either."""
+    return f".{host_key.lstrip('.')}".endswith(APPLE_DOMAINS)
+
+def _chrome_safe_storage_key() -> Optional[bytes]:
+    """Fetch Chrome's Safe Storage password from the macOS keychain."""
+    cmd = ['security', 'find-generic-password', '-w', '-a', 'Chrome', '-s', 'Chrome Safe Storage']
+    try:
+        return subprocess.check_output(cmd).strip()
+    except (subprocess.CalledProcessError, OSError):
+        logger.error("Failed to get Chrome encryption key from keychain")
+        return None
+
+def _chrome_cookie_key() -> Optional[bytes]:
+    """
+    Derive the AES key Chrome encrypts v10 cookies with (PBKDF2 is the slow part).
+    
+    Only a successful derivation is cached, so a denied or locked keychain is
+    asked again next time. Callers hold _KEY_LOCK.
+    """
+    global _cookie_key
+    if _cookie_key is None:
+        password = _chrome_safe_storage_key()
+        if password is None:
+            return None
+        _cookie_key = hashlib.pbkdf2_hmac('sha1', password, CHROME_KEY_SALT, CHROME_KEY_ITERATIONS, CHROME_KEY_LENGTH)
+    return _cookie_key
+
+def _cookies_db_version(cursor: sqlite3.Cursor) -> int:
+    """Read the Cookies database's schema version from its meta table (0 if unknown)."""
+    try:
+        row = cursor.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+    except (sqlite3.Error, ValueError, TypeError):
+        return 0
+
+def _decrypt_v10(encrypted_value: bytes, key: bytes, strip_host_hash: bool = False) -> str:
+    """Decrypt a v10 cookie value: AES-128-CBC with a fixed IV of 16 spaces."""
+    # cryptography hands this to OpenSSL, which uses hardware AES where available
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(b' ' * 16)).decryptor()
+    decrypted = decryptor.update(encrypted_value[3:]) + decryptor.finalize()
+    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+    plaintext = unpadder.update(decrypted) + unpadder.finalize()
+    if strip_host_hash:
+        plaintext = plaintext[HOST_HASH_LENGTH:]
+    return plaintext.decode('utf-8')
+
+def _fast_copy(src, dst):
+    """Copy src to dst, letting the kernel move the bytes where possible."""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if hasattr(os, "copy_file_range"):
+            # Linux: kernel-side copy (a reflink on btrfs/xfs)
+            try:
+                chunk = max(os.fstat(fsrc.fileno()).st_size, 1)
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), chunk):
+                    pass
+                return
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        elif posix is not None and hasattr(posix, "_COPYFILE_DATA"):
+            # macOS: fcopyfile(3) copies without going through userspace
+            try:
+                shutil._fastcopy_fcopyfile(fsrc, fdst, posix._COPYFILE_DATA)
+                return
+            except Exception:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst)
+
+def _write_session(path: Path, session: dict):
+    """
+    Write a session file; these are machine state, so they are kept compact.
+    
+    The file is replaced atomically: readers (which may have it mmap'ed) never
+    see it truncated or half-written.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps(session))
+    os.replace(tmp_path, path)
 
 if __name__ == "__main__":
+    setup_logging()
     extractor = CookieExtractor()
     profiles_cookies = extractor.extract_all_profiles_cookies()
     print(f"Extracted cookies for {len(profiles_cookies)} profiles")
\ No newline at end of file
@@ -12,13 +12,27 @@ Usage:
 import os
 import sys
 import json
+import hashlib
 import sqlite3
 import shutil
 import tempfile
 import subprocess
 import argparse
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+try:
+    import posix
+except ImportError:  # Windows
+    posix = None
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib json module
+    orjson = None
 
 # iCloud cookie names we're looking for
 REQUIRED_COOKIES = [
@@ -30,6 +44,45 @@ REQUIRED_COOKIES = [
     "X-APPLE-ID-TOKEN",
 ]
 
+# Cookies on these domains or any of their subdomains (appleid.apple.com,
+# setup.icloud.com, ...) count as iCloud cookies
+APPLE_DOMAINS = (".apple.com", ".icloud.com")
+
+# Read-only tuning for the cookies database: we never write to it, so
+# journaling and fsync buy nothing
+READ_PRAGMAS = """
+    PRAGMA journal_mode=OFF;
+    PRAGMA synchronous=OFF;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA query_only=1;
+"""
+
+# Autocommit mode skips transaction bookkeeping around the SELECTs;
+# check_same_thread=False only drops sqlite3's thread-affinity check
+CONNECT_OPTIONS = {
+    "isolation_level": None,
+    "check_same_thread": False,
+    "cached_statements": 64,
+}
+
+# Parameters Chrome on macOS uses to derive its cookie encryption key
+CHROME_KEY_SALT = b"saltysalt"
+CHROME_KEY_ITERATIONS = 1003
+CHROME_KEY_LENGTH = 16
+
+# From this Cookies database version on, Chrome puts a SHA-256 hash of the
+# cookie's host_key in front of the plaintext before encrypting it
+HOST_HASH_DB_VERSION = 24
+HOST_HASH_LENGTH = 32
+
+# The derived key, cached only once a keychain lookup succeeds
+_cookie_key: Optional[bytes] = None
+
+# Memory-map up to 512 MB of the database so pages come straight from the OS
+# page cache rather than being copied into SQLite's private cache
+MMAP_SIZE = 512 * 1024 * 1024
+
 
 def get_chrome_cookie_path() -> Path:
     """Get the path to Chrome's Cookies database on macOS."""
@@ -60,40 +113,92 @@ def get_chrome_profiles() -> List[Dict[str, str]]:
         profiles.append({"name": "Default", "path": str(default_path), "id": "default"})
 
     # Look for numbered profiles
-    for item in chrome_dir.glob("Profile *"):
-        if item.is_dir() and (item / "Cookies").exists():
-            profile_id = item.name.lower().replace(" ", "_")
-            profiles.append({"name": item.name, "path": str(item), "id": profile_id})
+    try:
+        with os.scandir(chrome_dir) as entries:
+            for entry in entries:
+                if (
+                    entry.name.startswith("Profile ")
+                    and entry.is_dir(follow_symlinks=False)
+                    and os.path.exists(os.path.join(entry.path, "Cookies"))
+                ):
+                    profile_id = entry.name.lower().replace(" ", "_")
+                    profiles.append(
+                        {"name": entry.name, "path": entry.path, "id": profile_id}
+                    )
+    except FileNotFoundError:
+        pass
 
     return profiles
 
 
-def decrypt_cookie_value(encrypted_value: bytes) -> Optional[str]:
+def is_apple_host(host_key: str) -> bool:
+    """Check whether host_key is apple.com, icloud.com or a subdomain of either."""
+    return f".{host_key.lstrip('.')}".endswith(APPLE_DOMAINS)
+
+
+def get_chrome_safe_storage_key() -> Optional[bytes]:
+    """Get Chrome's Safe Storage password from the macOS keychain."""
+    cmd = [
+        "security",
+        "find-generic-password",
+        "-w",
+        "-a",
+        "Chrome",
+        "-s",
+        "Chrome Safe Storage",
+    ]
+    try:
+        return subprocess.check_output(cmd).strip()
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error accessing macOS keychain: {e}")
+        return None
+
+
+def get_chrome_cookie_key() -> Optional[bytes]:
+    """
+    Derive the AES key Chrome uses for v10 cookies.
+
+    PBKDF2 is deliberately slow, so the key is derived once and cached; a
+    failed keychain lookup is not cached and is retried on the next call.
+    """
+    global _cookie_key
+    if _cookie_key is None:
+        password = get_chrome_safe_storage_key()
+        if password is None:
+            return None
+        _cookie_key = hashlib.pbkdf2_hmac(
+            "sha1", password, CHROME_KEY_SALT, CHROME_KEY_ITERATIONS, CHROME_KEY_LENGTH
+        )
+    return _cookie_key
+
+
+def decrypt_cookie_value(
+    encrypted_value: bytes, strip_host_hash: bool = False
+) -> Optional[str]:
     """
     Decrypt Chrome cookie value on macOS using the system keychain.
 
-    This is a simplified version that works for many cookie types.
-    For v10 cookies, would need more complex decryption using the Chrome Safe Storage key.
+    v10 cookies are AES-128-CBC encrypted with a key derived from the Chrome
+    Safe Storage password; older values are returned as-is. strip_host_hash
+    drops the host_key hash newer Chrome versions prefix the plaintext with.
     """
     # For newer Chrome versions with v10 encryption
     if encrypted_value.startswith(b"v10"):
-        try:
-            # Get Chrome's encryption key from macOS keychain
-            cmd = [
-                "security",
-                "find-generic-password",
-                "-w",
-                "-a",
-                "Chrome",
-                "-s",
-                "Chrome Safe Storage",
-            ]
-            chrome_key = subprocess.check_output(cmd).strip()
-            print(f"WARNING: v10 encrypted cookie found. Advanced decryption needed.")
-            # Full v10 decryption would require PBKDF2 and AES operations
+        key = get_chrome_cookie_key()
+        if key is None:
             return None
-        except subprocess.CalledProcessError as e:
-            print(f"Error accessing macOS keychain: {e}")
+        try:
+            # cryptography hands this to OpenSSL, which uses hardware AES
+            # where available
+            decryptor = Cipher(algorithms.AES(key), modes.CBC(b" " * 16)).decryptor()
+            decrypted = decryptor.update(encrypted_value[3:]) + decryptor.finalize()
+            unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+            plaintext = unpadder.update(decrypted) + unpadder.finalize()
+            if strip_host_hash:
+                plaintext = plaintext[HOST_HASH_LENGTH:]
+            return plaintext.decode("utf-8")
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"Error decrypting v10 cookie: {e}")
             return None
 
     # For older/simpler cookie encryption
@@ -105,6 +210,68 @@ def decrypt_cookie_value(encrypted_value: bytes) -> Optional[str]:
         return encrypted_value.hex()
 
 
+def cookies_db_version(cursor: sqlite3.Cursor) -> int:
+    """Read the Cookies database's schema version from its meta table (0 if unknown)."""
+    try:
+        row = cursor.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+    except (sqlite3.Error, ValueError, TypeError):
+        return 0
+
+
+def fast_copy(src, dst):
+    """Copy src to dst, letting the kernel move the bytes where possible."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if hasattr(os, "copy_file_range"):
+            # Linux: kernel-side copy (a reflink on btrfs/xfs)
+            try:
+                chunk = max(os.fstat(fsrc.fileno()).st_size, 1)
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), chunk):
+                    pass
+                return
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        elif posix is not None and hasattr(posix, "_COPYFILE_DATA"):
+            # macOS: fcopyfile(3) copies without going through userspace
+            try:
+                shutil._fastcopy_fcopyfile(fsrc, fdst, posix._COPYFILE_DATA)
+                return
+            except Exception:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst)
+
+
+def connect_cookies_db(cookies_path: Path) -> Tuple[sqlite3.Connection, Optional[str]]:
+    """
+    Open Chrome's Cookies database, avoiding a copy where possible.
+
+    The database is opened read-only and immutable, which takes no locks even
+    while Chrome is running. If that fails, the database is copied to a
+    temporary directory instead; the directory is returned so the caller can
+    clean it up (None when the original file was opened in place).
+    """
+    conn = None
+    try:
+        uri = f"{cookies_path.resolve().as_uri()}?mode=ro&immutable=1&nolock=1"
+        conn = sqlite3.connect(uri, uri=True, **CONNECT_OPTIONS)
+        conn.execute("SELECT 1 FROM cookies LIMIT 1")
+        return conn, None
+    except sqlite3.OperationalError as e:
+        if conn is not None:
+            conn.close()
+        print(f"Could not open cookies database in place ({e}), using a copy")
+
+    # Create a temporary copy of the database (since Chrome might have it locked)
+    temp_dir = tempfile.mkdtemp()
+    temp_db_path = os.path.join(temp_dir, "chrome_cookies.db")
+    fast_copy(str(cookies_path), temp_db_path)
+    return sqlite3.connect(temp_db_path, **CONNECT_OPTIONS), temp_dir
+
+
 def extract_cookies(profile_path: str) -> Dict[str, str]:
     """Extract iCloud cookies from the specified Chrome profile."""
     cookies_path = Path(profile_path) / "Cookies"
@@ -113,43 +280,55 @@ def extract_cookies(profile_path: str) -> Dict[str, str]:
         print(f"Cookies database not found at: {cookies_path}")
         return {}
 
-    # Create a temporary copy of the database (since Chrome might have it locked)
-    temp_dir = tempfile.mkdtemp()
-    temp_db_path = os.path.join(temp_dir, "chrome_cookies.db")
+    temp_dir = None
 
     try:
-        # Copy the database
-        shutil.copy2(str(cookies_path), temp_db_path)
-
-        # Connect to the copied database
-        conn = sqlite3.connect(temp_db_path)
+        conn, temp_dir = connect_cookies_db(cookies_path)
         cursor = conn.cursor()
+        cursor.executescript(READ_PRAGMAS)
+        try:
+            cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        except sqlite3.DatabaseError:
+            pass  # mmap is disabled on some platforms/builds
+        strip_host_hash = cookies_db_version(cursor) >= HOST_HASH_DB_VERSION
+
+        # Chrome normally leaves `value` empty and keeps the cookie data in
+        # `encrypted_value`, so query those rows first and only look up
+        # plaintext values for cookies that are still missing
+        name_placeholders = ",".join("?" * len(REQUIRED_COOKIES))
+        cursor.execute(
+            "SELECT name, host_key, encrypted_value FROM cookies "
+            f"WHERE name IN ({name_placeholders}) AND value = ''",
+            REQUIRED_COOKIES,
+        )
 
         cookies = {}
-        for cookie_name in REQUIRED_COOKIES:
-            # Query for cookies from apple.com domains
+        for name, host_key, encrypted_value in cursor:
+            if not is_apple_host(host_key):
+                continue
+            if encrypted_value:
+                decrypted = decrypt_cookie_value(encrypted_value, strip_host_hash)
+                if decrypted:
+                    cookies[name] = decrypted
+                    print(f"Found cookie: {name} (encrypted) from {host_key}")
+
+        missing = [cookie for cookie in REQUIRED_COOKIES if cookie not in cookies]
+        if missing:
+            name_placeholders = ",".join("?" * len(missing))
             cursor.execute(
-                "SELECT name, value, host_key, encrypted_value FROM cookies "
-                "WHERE name = ? AND host_key LIKE '%apple.com%'",
-                (cookie_name,),
+                "SELECT name, value, host_key FROM cookies "
+                f"WHERE name IN ({name_placeholders}) AND value != ''",
+                missing,
             )
 
-            results = cursor.fetchall()
-            if results:
-                for row in results:
-                    name, value, host_key, encrypted_value = row
-
-                    # If we have a plaintext value, use it
-                    if value:
-                        cookies[name] = value
-                        print(f"Found cookie: {name} (plaintext) from {host_key}")
-                    # Otherwise try to decrypt the encrypted value
-                    elif encrypted_value:
-                        decrypted = decrypt_cookie_value(encrypted_value)
-                        if decrypted:
-                            cookies[name] = decrypted
-                            print(f"Found cookie: {name} (encrypted) from {host_key}")
-            else:
+            for name, value, host_key in cursor:
+                if not is_apple_host(host_key):
+                    continue
+                cookies[name] = value
+                print(f"Found cookie: {name} (plaintext) from {host_key}")
+
+        for cookie_name in REQUIRED_COOKIES:
+            if cookie_name not in cookies:
                 print(f"Cookie not found: {cookie_name}")
 
         conn.close()
@@ -160,17 +339,33 @@ def extract_cookies(profile_path: str) -> Dict[str, str]:
         return {}
     finally:
         # Clean up temporary directory
-        shutil.rmtree(temp_dir)
+        if temp_dir:
+            shutil.rmtree(temp_dir)
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """
+    Serialize obj to JSON, using orjson when it is installed.
+
+    Kept local (rather than shared with the bot) so this script keeps
+    working when copied on its own.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2) if indent else orjson.dumps(obj)
+    if indent:
+        return json.dumps(obj, indent=2).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
 
 def save_cookies(cookies: Dict[str, str], output_path: str):
     """Save extracted cookies to a JSON file."""
     try:
-        with open(output_path, "w") as f:
-            json.dump(
-                {"cookies": cookies, "timestamp": __import__("time").time()},
-                f,
-                indent=2,
+        with open(output_path, "wb") as f:
+            f.write(
+                dumps(
+                    {"cookies": cookies, "timestamp": __import__("time").time()},
+                    indent=True,
+                )
             )
         print(f"Cookies saved to: {output_path}")
     except Exception as e:
@@ -1,23 +1,25 @@
 # generator_client.py
 import os
-import json
+import sys
+import re
+import importlib.util
+import inspect
 import logging
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+from _logging import setup_logging
+from _serialize import dumps, loads
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/bot.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("generator_client")
 
+# Matches an email in the generator output, with or without a "Generated email:" prefix
+_EMAIL_RE = re.compile(r"(?:Generated email:\s*)?([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})")
+
 class HideMyEmailGenerator:
     def __init__(self, generator_path: str = "hidemyemail-generator"):
         """
@@ -39,6 +41,46 @@ class HideMyEmailGenerator:
         if not self.main_script.exists():
             logger.error(f"Generator main script not found: {self.main_script}")
             raise FileNotFoundError(f"Generator main script not found: {self.main_script}")
+        
+        # Prefer calling the generator in-process so we don't pay interpreter
+        # startup for every email; fall back to running its script otherwise
+        self._gen_fn = self._load_generator_fn()
+    
+    def _load_generator_fn(self) -> Optional[Callable]:
+        """
+        Import the generator's main module and return its generate() function.
+        
+        Only a plain function callable as generate(cookies, label) -> email is
+        used; anything else (e.g. the upstream async generate(count)) returns
+        None so the generator is run as a script instead.
+        """
+        try:
+            # Let the generator resolve its own sibling imports
+            generator_dir = str(self.generator_path.resolve())
+            if generator_dir not in sys.path:
+                sys.path.insert(0, generator_dir)
+            
+            # Load by file location so it can't collide with our own main.py
+            spec = importlib.util.spec_from_file_location("hidemyemail_generator_main", self.main_script)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except (Exception, SystemExit) as e:
+            # SystemExit covers scripts that parse arguments at import time
+            logger.warning(f"Could not import generator in-process, using subprocess instead: {e}")
+            return None
+        
+        gen_fn = getattr(module, "generate", None)
+        if not callable(gen_fn):
+            return None
+        if inspect.iscoroutinefunction(gen_fn):
+            logger.info("Generator's generate() is async, using subprocess instead")
+            return None
+        try:
+            inspect.signature(gen_fn).bind({}, None)
+        except (TypeError, ValueError):
+            logger.info("Generator's generate() does not take (cookies, label), using subprocess instead")
+            return None
+        return gen_fn
     
     def load_session(self, profile_id: str) -> Optional[Dict]:
         """Load a session from the sessions directory."""
@@ -49,8 +91,8 @@ class HideMyEmailGenerator:
             return None
             
         try:
-            with open(session_path, 'r') as f:
-                return json.load(f)
+            with open(session_path, 'rb') as f:
+                return loads(f.read())
         except Exception as e:
             logger.error(f"Failed to load session for profile {profile_id}: {e}")
             return None
@@ -74,18 +116,24 @@ class HideMyEmailGenerator:
         if not cookies:
             logger.error(f"No cookies found in session for profile {profile_id}")
             return False, None
+        
+        if self._gen_fn:
+            result = self._generate_in_process(profile_id, cookies, label)
+            if result is not None:
+                return result
             
-        # Create a temporary cookie file for the generator
-        cookie_file = Path(f"temp_{profile_id}_cookies.json")
+        return self._generate_subprocess(profile_id, cookies, label)
+    
+    def _generate_subprocess(self, profile_id: str, cookies: Dict[str, str],
+                             label: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """Generate an email by running the generator's main script."""
         try:
-            with open(cookie_file, 'w') as f:
-                json.dump(cookies, f)
-                
-            # Build the command
+            # Build the command; the cookies are piped to the generator on stdin
+            # rather than through a temporary file
             cmd = [
                 "python", 
                 str(self.main_script),
-                "--cookie-file", str(cookie_file)
+                "--cookie-file", "/dev/stdin"
             ]
             
             if label:
@@ -93,17 +141,20 @@ class HideMyEmailGenerator:
                 
             # Execute the generator
             logger.info(f"Executing generator for profile {profile_id}")
-            result = subprocess.run(
+            process = subprocess.Popen(
                 cmd,
-                capture_output=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True,
                 cwd=str(self.generator_path)
             )
+            stdout, stderr = process.communicate(dumps(cookies).decode('utf-8'))
             
             # Process the output
-            if result.returncode == 0:
+            if process.returncode == 0:
                 # Parse the output to extract the generated email
-                output = result.stdout.strip()
+                output = stdout.strip()
                 generated_email = self._parse_email_from_output(output)
                 
                 if generated_email:
@@ -113,31 +164,53 @@ class HideMyEmailGenerator:
                     logger.error(f"Failed to parse generated email from output: {output}")
                     return False, None
             else:
-                logger.error(f"Generator failed with code {result.returncode}: {result.stderr}")
+                logger.error(f"Generator failed with code {process.returncode}: {stderr}")
                 return False, None
                 
         except Exception as e:
             logger.error(f"Error generating email for profile {profile_id}: {e}")
             return False, None
-        finally:
-            # Clean up the temporary cookie file
-            if cookie_file.exists():
-                cookie_file.unlink()
+    
+    def _generate_in_process(self, profile_id: str, cookies: Dict[str, str],
+                             label: Optional[str] = None) -> Optional[Tuple[bool, Optional[str]]]:
+        """
+        Generate an email by calling the imported generator directly.
+        
+        Returns None if generate() handed back an awaitable instead of running,
+        so the caller can fall back to the subprocess path. Any other failure
+        counts as a failed generation, since the generator may already have
+        created an alias.
+        """
+        logger.info(f"Running generator in-process for profile {profile_id}")
+        try:
+            generated_email = self._gen_fn(cookies, label)
+        except Exception as e:
+            logger.error(f"Error generating email for profile {profile_id}: {e}")
+            return False, None
+        
+        if inspect.isawaitable(generated_email):
+            # Nothing has run yet, so the subprocess can safely take over
+            logger.warning("In-process generator returned an awaitable, using subprocess instead")
+            if inspect.iscoroutine(generated_email):
+                generated_email.close()
+            return None
+            
+        if not isinstance(generated_email, (str, type(None))):
+            logger.error(f"Generator returned {type(generated_email).__name__} instead of an email for profile {profile_id}")
+            return False, None
+        
+        if generated_email:
+            logger.info(f"Successfully generated email for profile {profile_id}: {generated_email}")
+            return True, generated_email
+        
+        logger.error(f"Generator returned no email for profile {profile_id}")
+        return False, None
     
     def _parse_email_from_output(self, output: str) -> Optional[str]:
         """Parse the generated email address from the generator output."""
         # Example implementation - adjust based on actual output format
-        lines = output.splitlines()
-        for line in lines:
-            if "@" in line and "." in line and "Generated email:" in line:
-                return line.split("Generated email:")[1].strip()
-            elif "@" in line and "." in line:
-                # If there's only an email in the output
-                parts = line.split()
-                for part in parts:
-                    if "@" in part and "." in part:
-                        return part.strip()
-        return None
+        match = _EMAIL_RE.search(output)
+        return match.group(1) if match else None
         
     def generate_batch(self, profile_ids: List[str], count_per_profile: int = 1, 
                      label_prefix: str = "Auto_") -> Dict[str, List[str]]:
@@ -152,26 +225,78 @@ class HideMyEmailGenerator:
         Returns:
             Dictionary mapping profile IDs to lists of generated emails
         """
-        results = {}
+        # A profile listed twice would hit the same account from two threads
+        # at once and break the per-profile spacing, so each runs once
+        profile_ids = list(dict.fromkeys(profile_ids))
+        results = {profile_id: [] for profile_id in profile_ids}
+        if not profile_ids:
+            return results
+        
+        # Labels are made unique by profile and index, so one timestamp serves the whole batch
+        batch_ts = int(time.time())
         
-        for profile_id in profile_ids:
-            results[profile_id] = []
+        # Each profile is a separate account, so only generations within a
+        # profile need to be spaced out; the profiles themselves run in parallel
+        with ThreadPoolExecutor(max_workers=min(8, len(profile_ids))) as executor:
+            futures = {
+                executor.submit(self.generate_for_profile, profile_id, count_per_profile,
+                                label_prefix, batch_ts): profile_id
+                for profile_id in profile_ids
+            }
             
-            for i in range(count_per_profile):
-                label = f"{label_prefix}{int(time.time())}_{i}"
-                success, email = self.generate_email(profile_id, label)
-                
-                if success and email:
-                    results[profile_id].append(email)
-                    
-                # Sleep to avoid rate limiting
-                if i < count_per_profile - 1:
-                    time.sleep(2)  # 2-second delay between generations
+            for future in as_completed(futures):
+                profile_id = futures[future]
+                try:
+                    results[profile_id] = future.result()
+                except Exception as e:
+                    logger.error(f"Error generating emails for profile {profile_id}: {e}")
         
         return results
+    
+    def generate_for_profile(self, profile_id: str, count: int = 1,
+                             label_prefix: str = "Auto_",
+                             batch_ts: Optional[int] = None,
+                             stop_event: Optional[threading.Event] = None) -> List[str]:
+        """
+        Generate multiple email addresses using a single profile.
+        
+        Args:
+            profile_id: ID of the profile to use
+            count: Number of emails to generate
+            label_prefix: Prefix for the email labels
+            batch_ts: Timestamp to use in the labels (defaults to now)
+            stop_event: If given, stop early (between emails) once it is set
+            
+        Returns:
+            List of generated emails
+        """
+        emails = []
+        if batch_ts is None:
+            batch_ts = int(time.time())
+        
+        for i in range(count):
+            if stop_event and stop_event.is_set():
+                logger.info(f"Stopping generation for profile {profile_id} after {len(emails)} emails")
+                break
+                
+            label = f"{label_prefix}{batch_ts}_{profile_id}_{i}"
+            success, email = self.generate_email(profile_id, label)
+            
+            if success and email:
+                emails.append(email)
+                
+            # Sleep to avoid rate limiting
+            if i < count - 1:
+                # 2-second delay between generations, cut short by stop_event
+                if stop_event:
+                    stop_event.wait(2)
+                else:
+                    time.sleep(2)
+        
+        return emails
 
 if __name__ == "__main__":
-    import sys
+    setup_logging()
     
     if len(sys.argv) < 2:
         print("Usage: python generator_client.py <profile_id> [label]")
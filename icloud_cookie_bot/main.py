@@ -1,29 +1,26 @@
 # main.py
 import os
 import sys
+import copy
 import json
+import mmap
 import time
 import logging
+import signal
 import argparse
+import itertools
 import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Union
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Union
 
-# Import our modules
-from extract_cookies import CookieExtractor
-from generator_client import HideMyEmailGenerator
-from scheduler import TaskScheduler
+# Import our modules; the extractor and generator (sqlite3, cryptography)
+# are imported in ConsoleUI.__init__ so --help and argument errors stay fast
+from scheduler import TaskScheduler, load_config
+from _logging import setup_logging
+from _serialize import HAS_ORJSON, dumps, loads
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/bot.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("main")
 
 # ASCII art for the console header
@@ -34,15 +31,32 @@ HEADER = """
 ╚═════════════════════════════════════════════════════════════╝
 """
 
+# Session files at least this large are mmap'ed for parsing; below it the
+# extra syscalls cost more than the copy they save
+MMAP_MIN_SIZE = 4096
+
+# Maps a profile name to its profile id: spaces become underscores
+_SLUG = str.maketrans(" ", "_")
+
 class ConsoleUI:
-    def __init__(self, config_path: str = "config.json"):
+    def __init__(self, config_path: str = "config.json", save_interval: float = 5.0):
         """
         Initialize the console UI.
         
         Args:
             config_path: Path to the configuration file
+            save_interval: Minimum seconds between configuration saves; edits
+                made in between are saved later or on exit
         """
+        from extract_cookies import CookieExtractor
+        from generator_client import HideMyEmailGenerator
+        
         self.config_path = config_path
+        self.save_interval = save_interval
+        
+        # Unsaved configuration changes, and when the config was last written
+        self._dirty = False
+        self._last_save = 0.0
         self.scheduler = TaskScheduler(config_path)
         self.extractor = CookieExtractor(config_path)
         self.generator = HideMyEmailGenerator()
@@ -61,8 +75,8 @@ class ConsoleUI:
     def _load_config(self) -> dict:
         """Load the configuration file."""
         try:
-            with open(self.config_path, 'r') as f:
-                return json.load(f)
+            # Our copy gets edited in place, so don't share the cached one
+            return copy.deepcopy(load_config(self.config_path))
         except FileNotFoundError:
             logger.warning(f"Configuration file not found: {self.config_path}")
             return self._create_default_config()
@@ -84,8 +98,7 @@ class ConsoleUI:
             config["profiles"] = profiles
             
         # Save the default configuration
-        with open(self.config_path, 'w') as f:
-            json.dump(config, f, indent=2)
+        _write_config(self.config_path, config)
             
         return config
         
@@ -101,18 +114,25 @@ class ConsoleUI:
             
         # Look for profile directories
         try:
-            for item in os.listdir(base_path):
-                profile_path = os.path.join(base_path, item)
-                
-                # Check if it's a directory and contains a Cookies file
-                if (os.path.isdir(profile_path) and 
-                    (item.startswith("Profile ") or item == "Default") and
-                    os.path.exists(os.path.join(profile_path, "Cookies"))):
-                    
-                    profile_id = item.lower().replace(" ", "_")
+            with os.scandir(base_path) as entries:
+                for entry in entries:
+                    # Filter on the name first so we never touch Chrome's other
+                    # (sometimes unreadable) data directories
+                    if not (entry.name.startswith("Profile ") or entry.name == "Default"):
+                        continue
+                        
+                    # Check if it's a directory and contains a Cookies file
+                    try:
+                        if not (entry.is_dir(follow_symlinks=False) and
+                                os.path.exists(os.path.join(entry.path, "Cookies"))):
+                            continue
+                    except PermissionError:
+                        continue
+                        
+                    profile_id = _slugify(entry.name)
                     profiles.append({
-                        "name": item,
-                        "path": profile_path,
+                        "name": entry.name,
+                        "path": entry.path,
                         "id": profile_id
                     })
                     
@@ -162,7 +182,7 @@ class ConsoleUI:
             
             if profile_id in status['stats']['emails_generated']:
                 emails = status['stats']['emails_generated'][profile_id]
-                extractions = status['stats']['extraction_counts'][profile_id]
+                extractions = status['stats']['extraction_counts'].get(profile_id, 0)
                 
                 print(f"Profile {profile['name']}:")
                 print(f"  - Emails generated: {emails}")
@@ -197,7 +217,7 @@ class ConsoleUI:
             # Add a new profile
             name = input("Enter profile name: ")
             path = input("Enter profile path: ")
-            profile_id = name.lower().replace(" ", "_")
+            profile_id = _slugify(name)
             
             profiles.append({
                 "name": name,
@@ -205,7 +225,7 @@ class ConsoleUI:
                 "id": profile_id
             })
             
-            self._save_config()
+            self._maybe_save()
             print(f"Profile '{name}' added.")
             
         elif choice == "2":
@@ -228,7 +248,7 @@ class ConsoleUI:
                     if path:
                         profile["path"] = path
                         
-                    self._save_config()
+                    self._maybe_save()
                     print("Profile updated.")
                 else:
                     print("Invalid profile number.")
@@ -246,7 +266,7 @@ class ConsoleUI:
                 idx = int(idx) - 1
                 if 0 <= idx < len(profiles):
                     removed = profiles.pop(idx)
-                    self._save_config()
+                    self._maybe_save()
                     print(f"Profile '{removed.get('name')}' removed.")
                 else:
                     print("Invalid profile number.")
@@ -268,7 +288,7 @@ class ConsoleUI:
             confirm = input("\nReplace existing profiles with these? (y/n): ")
             if confirm.lower() == "y":
                 self.config["profiles"] = detected
-                self._save_config()
+                self._maybe_save()
                 print("Profiles updated.")
                 
         input("\nPress Enter to continue...")
@@ -276,123 +296,146 @@ class ConsoleUI:
     def _save_config(self):
         """Save the configuration to file."""
         try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=2)
+            _write_config(self.config_path, self.config)
+            self._dirty = False
+            self._last_save = time.time()
             logger.info("Configuration saved.")
         except Exception as e:
             logger.error(f"Failed to save configuration: {e}")
             
+    def _maybe_save(self):
+        """Mark the configuration as changed and save it, unless it was saved very recently."""
+        self._dirty = True
+        if time.time() - self._last_save > self.save_interval:
+            self._save_config()
+            
+    def _flush_config(self):
+        """Save any configuration changes that haven't been written yet."""
+        if self._dirty:
+            self._save_config()
+            
     def view_generated_emails(self):
         """View the generated emails."""
         print("\nGenerated Emails:")
         
-        # Get all session files
+        # Get all session files, peeking at the first to tell whether there are any
         sessions_dir = Path("sessions")
-        session_files = list(sessions_dir.glob("*.json"))
+        session_files = _iter_session_files(sessions_dir)
+        first = next(session_files, None)
         
-        if not session_files:
+        if first is None:
             print("No sessions found.")
             input("\nPress Enter to continue...")
             return
             
+        # Look up profile names and email counts once rather than per session
+        id_to_name = {p["id"]: p.get("name") for p in self.config.get("profiles", []) if p.get("id")}
+        emails_generated = self.scheduler.get_status()['stats']['emails_generated']
+            
         # Load and display sessions
-        for session_file in session_files:
-            profile_id = session_file.stem
+        for session_file in itertools.chain((first,), session_files):
+            profile_id = session_file.name[:-len(".json")]
             
             try:
-                with open(session_file, 'r') as f:
-                    session = json.load(f)
+                session = _load_session(session_file)
                     
                 # Find the profile name
-                profile_name = profile_id
-                for profile in self.config.get("profiles", []):
-                    if profile.get("id") == profile_id:
-                        profile_name = profile.get("name")
-                        break
+                profile_name = id_to_name.get(profile_id, profile_id)
                         
                 print(f"\nProfile: {profile_name}")
                 print(f"Last updated: {datetime.fromtimestamp(session.get('timestamp', 0))}")
                 
                 # Get emails for this profile from the email log
                 # In a real implementation, we would store generated emails
-                status = self.scheduler.get_status()
-                count = status['stats']['emails_generated'].get(profile_id, 0)
+                count = emails_generated.get(profile_id, 0)
                 print(f"Total emails generated: {count}")
                 
             except Exception as e:
-                logger.error(f"Error reading session file {session_file}: {e}")
+                logger.error(f"Error reading session file {session_file.path}: {e}")
                 
         input("\nPress Enter to continue...")
         
+    def _clear_screen(self):
+        """Clear the terminal with an ANSI escape rather than spawning `clear`."""
+        if sys.stdout.isatty():
+            sys.stdout.write("\x1b[2J\x1b[H")
+            sys.stdout.flush()
+            
     def run_cli(self):
         """Run the command-line interface."""
         self.running = True
         
-        while self.running:
-            os.system('clear')  # macOS uses 'clear'
-            choice = self.display_menu()
-            
-            if choice == "1":
-                # Start scheduler
-                if self.scheduler.start():
-                    print("Scheduler started.")
-                else:
-                    print("Failed to start scheduler.")
-                    
-                input("\nPress Enter to continue...")
+        # Edits held back by the save throttle are written however the menu
+        # exits: option 7, Ctrl+C, EOF on input() or an unexpected error
+        try:
+            while self.running:
+                self._clear_screen()
+                choice = self.display_menu()
                 
-            elif choice == "2":
-                # Stop scheduler
-                if self.scheduler.stop():
-                    print("Scheduler stopped.")
-                else:
-                    print("Scheduler is not running.")
+                if choice == "1":
+                    # Start scheduler
+                    if self.scheduler.start():
+                        print("Scheduler started.")
+                    else:
+                        print("Failed to start scheduler.")
+                        
+                    input("\nPress Enter to continue...")
                     
-                input("\nPress Enter to continue...")
-                
-            elif choice == "3":
-                # Run jobs now
-                print("Running jobs now...")
-                result = self.scheduler.run_now()
-                
-                if result['cookies_extracted']:
-                    print("Cookies extracted successfully.")
-                else:
-                    print("Failed to extract cookies.")
+                elif choice == "2":
+                    # Stop scheduler
+                    if self.scheduler.stop():
+                        print("Scheduler stopped.")
+                    else:
+                        print("Scheduler is not running.")
+                        
+                    input("\nPress Enter to continue...")
                     
-                emails = result['emails_generated']
-                if emails:
-                    print(f"Generated {sum(len(emails) for emails in emails.values())} emails.")
-                else:
-                    print("No emails generated.")
+                elif choice == "3":
+                    # Run jobs now
+                    print("Running jobs now...")
+                    result = self.scheduler.run_now()
                     
-                input("\nPress Enter to continue...")
-                
-            elif choice == "4":
-                # View status
-                self.display_status()
-                
-            elif choice == "5":
-                # Configure profiles
-                self.configure_profiles()
-                
-            elif choice == "6":
-                # View generated emails
-                self.view_generated_emails()
-                
-            elif choice == "7":
-                # Exit
-                self.running = False
-                
-                # Stop the scheduler if it's running
-                if self.scheduler.running:
-                    self.scheduler.stop()
+                    if result['cookies_extracted']:
+                        print("Cookies extracted successfully.")
+                    else:
+                        print("Failed to extract cookies.")
+                        
+                    total = sum(map(len, result['emails_generated'].values()))
+                    if total:
+                        print(f"Generated {total} emails.")
+                    else:
+                        print("No emails generated.")
+                        
+                    input("\nPress Enter to continue...")
                     
-                print("Exiting...")
-                
-            else:
-                print("Invalid choice. Please try again.")
-                input("\nPress Enter to continue...")
+                elif choice == "4":
+                    # View status
+                    self.display_status()
+                    
+                elif choice == "5":
+                    # Configure profiles
+                    self.configure_profiles()
+                    
+                elif choice == "6":
+                    # View generated emails
+                    self.view_generated_emails()
+                    
+                elif choice == "7":
+                    # Exit
+                    self.running = False
+                    self._flush_config()
+                    
+                    # Stop the scheduler if it's running
+                    if self.scheduler.running:
+                        self.scheduler.stop()
+                        
+                    print("Exiting...")
+                    
+                else:
+                    print("Invalid choice. Please try again.")
+                    input("\nPress Enter to continue...")
+        finally:
+            self._flush_config()
                 
     def run_daemon(self):
         """Run as a daemon process without UI."""
@@ -402,23 +445,63 @@ class ConsoleUI:
         # Start the scheduler
         self.scheduler.start()
         
+        # Sleep until the next job boundary (at most a minute) instead of
+        # polling every second; Ctrl+C or SIGTERM sets the event and wakes us
+        # at once, so both shut down cleanly
+        stop = threading.Event()
+        previous_handlers = {
+            signum: signal.signal(signum, lambda signum, frame: stop.set())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        
         try:
-            # Keep running until interrupted
-            while True:
+            while not stop.is_set():
                 status = self.scheduler.get_status()
-                time_until = status.get('time_until_next', 0)
+                remaining = max(1, status.get('time_until_next') or 0)
                 
-                if time_until:
-                    minutes, seconds = divmod(time_until, 60)
-                    sys.stdout.write(f"\rNext job in: {int(minutes)}m {int(seconds)}s" + " " * 10)
-                    sys.stdout.flush()
-                    
-                time.sleep(1)
+                minutes, seconds = divmod(remaining, 60)
+                sys.stdout.write(f"\rNext job in: {int(minutes)}m {int(seconds)}s" + " " * 10)
+                sys.stdout.flush()
                 
-        except KeyboardInterrupt:
-            print("\n\nShutting down...")
-            self.scheduler.stop()
-            print("Goodbye!")
+                stop.wait(min(remaining, 60))
+        finally:
+            # A second Ctrl+C or SIGTERM during shutdown interrupts as usual
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            
+        print("\n\nShutting down...")
+        self.scheduler.stop()
+        print("Goodbye!")
+
+def _write_config(path: str, config: dict):
+    """Write the configuration atomically, so a crash never leaves a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps(config, indent=True))
+    os.replace(tmp_path, path)
+
+@lru_cache(maxsize=256)
+def _slugify(name: str) -> str:
+    """Build the profile id for a profile name, e.g. "Profile 1" -> "profile_1"."""
+    return name.translate(_SLUG).lower()
+
+def _iter_session_files(sessions_dir: Path) -> Iterator[os.DirEntry]:
+    """Yield the session files in sessions_dir, without a stat call per entry."""
+    try:
+        with os.scandir(sessions_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json") and not entry.name.startswith(".") and entry.is_file():
+                    yield entry
+    except FileNotFoundError:
+        return
+
+def _load_session(path: Union[str, os.PathLike]) -> dict:
+    """Parse a session file, handing large files to orjson straight from an mmap."""
+    with open(path, 'rb') as f:
+        if HAS_ORJSON and os.fstat(f.fileno()).st_size >= MMAP_MIN_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return loads(view)
+        return loads(f.read())
 
 def main():
     """Main entry point."""
@@ -427,8 +510,8 @@ def main():
     parser.add_argument("--config", default="config.json", help="Path to configuration file")
     args = parser.parse_args()
     
-    # Ensure logs directory exists
-    Path("logs").mkdir(exist_ok=True)
+    # Configure logging (creates the logs directory)
+    setup_logging()
     
     # Create the console UI
     ui = ConsoleUI(args.config)
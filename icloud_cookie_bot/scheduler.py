@@ -1,28 +1,48 @@
 # scheduler.py
+import os
 import time
-import json
 import logging
-import schedule
+import asyncio
 import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Callable
+from types import MappingProxyType
+from typing import Dict, List, Optional, Callable, Tuple
 
-# Import our modules
-from extract_cookies import CookieExtractor
-from generator_client import HideMyEmailGenerator
+# Import our modules; the extractor and generator (sqlite3, cryptography)
+# are imported in TaskScheduler.__init__ to keep startup fast
+from _logging import flush_logs, setup_logging
+from _serialize import loads
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/bot.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("scheduler")
 
+# Parsed config files keyed by absolute path, with the mtime they were read at
+_CONFIG_CACHE: Dict[str, Tuple[int, dict]] = {}
+
+def load_config(config_path: str) -> dict:
+    """
+    Load a JSON config file, reusing the parsed result while the file is unchanged.
+    
+    The returned dict is shared between callers, so copy it before mutating.
+    """
+    path = os.path.abspath(config_path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    
+    cached = _CONFIG_CACHE.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+        
+    with open(path, 'rb') as f:
+        config = loads(f.read())
+    _CONFIG_CACHE[path] = (mtime_ns, config)
+    return config
+
+def clear_config_cache():
+    """Forget all cached configs (mainly useful in tests)."""
+    _CONFIG_CACHE.clear()
+
 class TaskScheduler:
     def __init__(self, config_path: str = "config.json"):
         """
@@ -31,6 +51,9 @@ class TaskScheduler:
         Args:
             config_path: Path to the configuration file
         """
+        from extract_cookies import CookieExtractor
+        from generator_client import HideMyEmailGenerator
+        
         self.config_path = config_path
         self.config = self._load_config()
         self.cookie_extractor = CookieExtractor(config_path)
@@ -40,26 +63,67 @@ class TaskScheduler:
         self.running = False
         self.scheduler_thread = None
         
+        # Set by stop() so a cycle still queued on, or running in, the job
+        # worker bails out instead of outliving the scheduler; generation
+        # checks it between emails
+        self._stop = threading.Event()
+        
+        # Event loop timing the jobs, and the worker the jobs run on
+        self._loop = None
+        self._timer = None
+        self._interval = 0
+        self._cycle_future = None
+        self._create_executors()
+        self._stats_lock = threading.Lock()
+        
         # Stats for UI display
         self.last_extraction = None
         self.next_scheduled = None
+        # Counters start at 0 for every configured profile; profiles added
+        # later start counting on first use
+        profile_ids = [p["id"] for p in self.config.get("profiles", []) if p.get("id")]
         self.stats = {
-            "emails_generated": {},
-            "extraction_counts": {}
+            "emails_generated": defaultdict(int, dict.fromkeys(profile_ids, 0)),
+            "extraction_counts": defaultdict(int, dict.fromkeys(profile_ids, 0))
         }
         
-        # Initialize stats for each profile
-        for profile in self.config.get("profiles", []):
-            profile_id = profile.get("id")
-            if profile_id:
-                self.stats["emails_generated"][profile_id] = 0
-                self.stats["extraction_counts"][profile_id] = 0
+        # Read-only view handed out by get_status()
+        self._stats_view = MappingProxyType(self.stats)
+        
+    @property
+    def last_extraction(self) -> Optional[datetime]:
+        """When the last extraction job started."""
+        return self._last_extraction
+        
+    @last_extraction.setter
+    def last_extraction(self, value: Optional[datetime]):
+        # Format once here rather than on every get_status() call
+        self._last_extraction = value
+        self._last_extraction_iso = value.isoformat() if value else None
+        
+    @property
+    def next_scheduled(self) -> Optional[float]:
+        """Timestamp of the next scheduled run."""
+        return self._next_scheduled
+        
+    @next_scheduled.setter
+    def next_scheduled(self, value: Optional[float]):
+        # Format once here rather than on every get_status() call
+        self._next_scheduled = value
+        self._next_scheduled_iso = datetime.fromtimestamp(value).isoformat() if value else None
                 
+    def _create_executors(self):
+        """Create the job worker and the per-profile pool (threads start on first use)."""
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scheduler-job")
+        
+        # Per-profile extraction and generation tasks run in parallel on this pool
+        profile_count = sum(1 for p in self.config.get("profiles", []) if p.get("id"))
+        self._pool = ThreadPoolExecutor(max_workers=min(32, profile_count + 4), thread_name_prefix="profile")
+        
     def _load_config(self) -> dict:
         """Load the configuration from the specified path."""
         try:
-            with open(self.config_path, 'r') as f:
-                return json.load(f)
+            return load_config(self.config_path)
         except Exception as e:
             logger.error(f"Failed to load configuration: {e}")
             return {
@@ -68,81 +132,167 @@ class TaskScheduler:
                 "refresh_interval_minutes": 60
             }
             
-    def extract_cookies_job(self):
-        """Job to extract cookies from all profiles."""
+    def extract_cookies_job(self, force: bool = False):
+        """
+        Job to extract cookies from all profiles.
+        
+        Args:
+            force: Re-extract even profiles whose Cookies file is unchanged
+        """
         logger.info("Running scheduled cookie extraction job")
         self.last_extraction = datetime.now()
         
         try:
-            # Extract cookies from all profiles
-            cookies = self.cookie_extractor.extract_all_profiles_cookies()
+            # Extract cookies from all profiles in parallel
+            profiles = [p for p in self.config.get("profiles", []) if p.get("id")]
+            futures = {
+                self._pool.submit(self.cookie_extractor.extract_profile, profile, force): profile["id"]
+                for profile in profiles
+            }
             
-            # Update stats
-            for profile_id in cookies:
-                if profile_id in self.stats["extraction_counts"]:
-                    self.stats["extraction_counts"][profile_id] += 1
+            cookies = {}
+            for future in as_completed(futures):
+                profile_id = futures[future]
+                try:
+                    profile_cookies = future.result()
+                except Exception as e:
+                    logger.error(f"Error extracting cookies for profile {profile_id}: {e}")
+                    continue
+                
+                if profile_cookies:
+                    cookies[profile_id] = profile_cookies
+                    
+                    # Update stats
+                    with self._stats_lock:
+                        self.stats["extraction_counts"][profile_id] += 1
                     
             logger.info(f"Successfully extracted cookies for {len(cookies)} profiles")
             return cookies
         except Exception as e:
             logger.error(f"Error in cookie extraction job: {e}")
             return {}
+        finally:
+            # Get the job's records into logs/bot.log without waiting for the buffer to fill
+            flush_logs()
             
-    def generate_emails_job(self):
-        """Job to generate emails using extracted cookies."""
+    def generate_emails_job(self, stop_event: Optional[threading.Event] = None):
+        """
+        Job to generate emails using extracted cookies.
+        
+        Args:
+            stop_event: Event that ends generation early when set (defaults to
+                the scheduler's current stop event)
+        """
+        if stop_event is None:
+            stop_event = self._stop
         logger.info("Running scheduled email generation job")
         
         try:
             # Get the email limit from config
             email_limit = self.config.get("email_limit_per_hour", 5)
             
-            # Get all profile IDs
-            profile_ids = [p.get("id") for p in self.config.get("profiles", []) if p.get("id")]
+            # Get all profile IDs, once each so no account runs on two threads
+            profile_ids = list(dict.fromkeys(p.get("id") for p in self.config.get("profiles", []) if p.get("id")))
             
-            # Generate emails
-            results = self.generator.generate_batch(profile_ids, email_limit)
+            # Generate emails for every profile in parallel, labelling them with one batch timestamp
+            batch_ts = int(time.time())
+            futures = {
+                self._pool.submit(self.generator.generate_for_profile, profile_id, email_limit,
+                                  batch_ts=batch_ts, stop_event=stop_event): profile_id
+                for profile_id in profile_ids
+            }
             
-            # Update stats
-            for profile_id, emails in results.items():
-                if profile_id in self.stats["emails_generated"]:
+            results = {}
+            for future in as_completed(futures):
+                profile_id = futures[future]
+                try:
+                    emails = future.result()
+                except Exception as e:
+                    logger.error(f"Error generating emails for profile {profile_id}: {e}")
+                    continue
+                results[profile_id] = emails
+                
+                # Update stats
+                with self._stats_lock:
                     self.stats["emails_generated"][profile_id] += len(emails)
                     
             logger.info(f"Successfully generated {sum(len(emails) for emails in results.values())} emails")
             
-            # Log the results
+            # Log the results, one record per profile
             for profile_id, emails in results.items():
-                logger.info(f"Profile {profile_id}: Generated {len(emails)} emails")
-                for email in emails:
-                    logger.info(f"  - {email}")
+                listing = "".join(f"\n  - {email}" for email in emails)
+                logger.info(f"Profile {profile_id}: Generated {len(emails)} emails{listing}")
                     
             return results
         except Exception as e:
             logger.error(f"Error in email generation job: {e}")
             return {}
+        finally:
+            flush_logs()
             
     def schedule_jobs(self):
         """Schedule jobs based on the configuration."""
         # Get the refresh interval
         refresh_interval = self.config.get("refresh_interval_minutes", 60)
+        self._interval = refresh_interval * 60
+        
+        # The jobs are timed on an event loop that runs in the scheduler thread
+        self._loop = asyncio.new_event_loop()
         
-        # Schedule the cookie extraction job
-        schedule.every(refresh_interval).minutes.do(self.extract_cookies_job)
+        # Schedule one cycle that extracts cookies and then generates emails, so
+        # generation never runs ahead of the extraction it depends on
+        self._arm_timer()
+        
+        logger.info(f"Jobs scheduled to run every {refresh_interval} minutes")
         
-        # Schedule the email generation job (right after cookie extraction)
-        schedule.every(refresh_interval).minutes.do(self.generate_emails_job)
+    def _arm_timer(self):
+        """(Re)start the countdown to the next cycle."""
+        if self._timer:
+            self._timer.cancel()
+        self._timer = self._loop.call_later(self._interval, self._tick)
         
         # Set the next scheduled time
-        self.next_scheduled = datetime.now().timestamp() + (refresh_interval * 60)
+        self.next_scheduled = time.time() + self._interval
         
-        logger.info(f"Jobs scheduled to run every {refresh_interval} minutes")
+    def _tick(self):
+        """Run the cycle whose timer has fired and schedule its next run."""
+        self._timer = self._loop.call_later(self._interval, self._tick)
+        self.next_scheduled = time.time() + self._interval
         
-    def run_scheduler(self):
-        """Run the scheduler in a separate thread."""
-        self.running = True
+        # Skip this run rather than queue it behind a cycle that is still going,
+        # so a slow cycle doesn't turn into a burst of back-to-back ones
+        if self._cycle_future and not self._cycle_future.done():
+            logger.warning("Previous cycle is still running, skipping this one")
+            return
+            
+        # The jobs block on I/O, so run them off the loop; the single worker
+        # keeps cycles from overlapping
+        self._cycle_future = self._executor.submit(self._cycle)
+        
+    def _cycle(self):
+        """Extract cookies, then generate emails if any profile has cookies."""
+        # Hold on to this run's event; stop() replaces it once it has been set
+        stop_event = self._stop
+        if stop_event.is_set():
+            return
+        cookies = self.extract_cookies_job()
+        if cookies and not stop_event.is_set():
+            self.generate_emails_job(stop_event)
         
-        while self.running:
-            schedule.run_pending()
-            time.sleep(1)
+    def run_scheduler(self):
+        """Run the scheduler's event loop in a separate thread."""
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+            
+    def _stop_loop(self):
+        """Cancel the pending jobs and stop the event loop (runs on the loop)."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._loop.stop()
             
     def start(self):
         """Start the scheduler."""
@@ -157,6 +307,7 @@ class TaskScheduler:
         self.extract_cookies_job()
         
         # Start the scheduler thread
+        self.running = True
         self.scheduler_thread = threading.Thread(target=self.run_scheduler)
         self.scheduler_thread.daemon = True
         self.scheduler_thread.start()
@@ -171,10 +322,24 @@ class TaskScheduler:
             return False
             
         self.running = False
+        self._stop.set()
+        self._loop.call_soon_threadsafe(self._stop_loop)
         
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
             
+        # The workers aren't daemon threads, so interpreter exit waits for them.
+        # Nothing is cancelled: a job blocked in as_completed() is never told
+        # about futures cancelled by shutdown() and would hang. Work still queued
+        # sees the stop event and returns at once; later runs get fresh executors
+        self._executor.shutdown(wait=False)
+        self._pool.shutdown(wait=False)
+        self._create_executors()
+        
+        # Cycles still winding down keep the set event; manual runs and the
+        # next start() get a fresh one
+        self._stop = threading.Event()
+            
         logger.info("Scheduler stopped")
         return True
         
@@ -182,32 +347,50 @@ class TaskScheduler:
         """Get the current status of the scheduler."""
         return {
             "running": self.running,
-            "last_extraction": self.last_extraction.isoformat() if self.last_extraction else None,
-            "next_scheduled": datetime.fromtimestamp(self.next_scheduled).isoformat() if self.next_scheduled else None,
-            "time_until_next": int(self.next_scheduled - time.time()) if self.next_scheduled else None,
-            "stats": self.stats
+            "last_extraction": self._last_extraction_iso,
+            "next_scheduled": self._next_scheduled_iso,
+            "time_until_next": int(self._next_scheduled - time.time()) if self._next_scheduled else None,
+            "stats": self._stats_view
         }
         
     def run_now(self) -> Dict:
         """Run the extraction and generation jobs immediately."""
         logger.info("Running jobs now")
         
-        # Run the extraction job
-        cookies = self.extract_cookies_job()
+        if self.running:
+            # Go through the scheduler's loop so the jobs queue behind any
+            # scheduled run in progress, and the countdown restarts from now
+            return asyncio.run_coroutine_threadsafe(self._run_now_on_loop(), self._loop).result()
         
-        # Run the generation job
-        emails = self.generate_emails_job()
+        result = self._run_jobs()
         
         # Update the next scheduled time
         refresh_interval = self.config.get("refresh_interval_minutes", 60)
         self.next_scheduled = datetime.now().timestamp() + (refresh_interval * 60)
         
+        return result
+        
+    async def _run_now_on_loop(self) -> Dict:
+        """Restart the cycle timer and run the jobs on the job worker."""
+        self._arm_timer()
+        return await asyncio.wrap_future(self._executor.submit(self._run_jobs))
+        
+    def _run_jobs(self) -> Dict:
+        """Run the extraction job followed by the generation job."""
+        # Run the extraction job, re-reading every profile since this is a manual refresh
+        cookies = self.extract_cookies_job(force=True)
+        
+        # Run the generation job
+        emails = self.generate_emails_job()
+        
         return {
             "cookies_extracted": bool(cookies),
             "emails_generated": emails
         }
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Create a simple CLI for testing the scheduler
     scheduler = TaskScheduler()
     